@@ -0,0 +1,311 @@
+"""Micro-benchmarks for the frame processing hot paths.
+
+Run from the dir next to main.py:
+
+    python bench.py capture --frames 100 --region 640x640
+    python bench.py overlay --draws 1000
+    python bench.py replay SESSION_DIR [--realtime] [--latency 0.05]
+    python bench.py replay --synthetic 600
+
+Sessions are recorded by running main.py with RECORD_DIR set in .env. Replays
+need no screen, input hooks or network.
+"""
+import argparse
+import os
+import tempfile
+from collections import deque
+import time
+import tracemalloc
+
+import cv2
+import numpy as np
+import pygame
+from mss import mss
+from PIL import Image
+
+import main
+
+
+def legacy_capture(monitor):
+    # The capture path before ScreenGrabber: new mss handle, full monitor, three copies
+    with mss() as sct:
+        sct_img = sct.grab(monitor)
+        frame = cv2.cvtColor(np.array(sct_img), cv2.COLOR_BGRA2BGR)
+        return Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+
+
+def measure(grab, frames):
+    """Return (ms per frame, peak bytes allocated per frame) for a grab callable."""
+    grab()  # Warm up, lets the grabber open its handle outside the measurement
+    elapsed = 0.0
+    peak = 0
+    tracemalloc.start()
+    for _ in range(frames):
+        tracemalloc.reset_peak()
+        start = time.perf_counter()
+        grab()
+        elapsed += time.perf_counter() - start
+        current, frame_peak = tracemalloc.get_traced_memory()
+        peak += frame_peak - current
+    tracemalloc.stop()
+    return elapsed / frames * 1000, peak / frames
+
+
+def bench_capture(frames, region_spec):
+    with mss() as sct:
+        monitor = sct.monitors[1]
+    region = main.capture_region(monitor, region_spec)
+    grabber = main.ScreenGrabber(region)
+    frame = np.empty((region["height"], region["width"], 3), dtype=np.uint8)
+
+    results = {
+        "legacy (full screen)": measure(lambda: legacy_capture(monitor), frames),
+        f"grabber ({region['width']}x{region['height']})": measure(lambda: grabber.grab(frame), frames),
+    }
+    grabber.close()
+
+    for name, (ms, allocated) in results.items():
+        print(f"{name:<28} {ms:8.2f} ms/frame {allocated / 1e6:10.2f} MB allocated/frame")
+
+
+def legacy_display_accuracy(surface, accuracy, screen_height):
+    # The draw before AccuracyOverlay: font lookup, full clear and full window update every call
+    surface.fill((0, 0, 0, 0))
+    font = pygame.font.SysFont("Arial", 30)
+    text_surface = font.render(f"Accuracy: {accuracy:.2f}%", True, (0, 255, 0))
+    surface.blit(text_surface, (10, screen_height - 40))
+    pygame.display.update()
+
+
+def bench_overlay(draws, width, height):
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # Headless unless a real driver was asked for
+    pygame.init()
+    surface = pygame.display.set_mode((width, height), pygame.SRCALPHA)
+    readout = main.AccuracyOverlay(surface, (10, height - 40))
+
+    # Accuracy only moves when a click is scored, so most draws repeat the last value
+    values = [round(100 * (i // 10 + 1) / (i // 10 + 2), 2) for i in range(draws)]
+
+    results = {}
+    for name, draw in (
+        ("legacy display_accuracy", lambda value: legacy_display_accuracy(surface, value, height)),
+        ("AccuracyOverlay.show", readout.show),
+    ):
+        start = time.perf_counter()
+        for value in values:
+            draw(value)
+        results[name] = (time.perf_counter() - start) / draws * 1000
+    pygame.quit()
+
+    for name, ms in results.items():
+        print(f"{name:<28} {ms:8.3f} ms/draw")
+
+
+class ReplayClock:
+    """Session time for a replay, handed to FrameProcessor as its clock.
+
+    Realtime replays run the clock at wall pace from the first recorded frame, so
+    latencies are the ones a player would see. Otherwise the clock jumps to each
+    frame's timestamp as it is fed and frames go in as fast as capture takes them.
+    """
+
+    def __init__(self, start, realtime):
+        self.start = start
+        self.now = start
+        self.realtime = realtime
+        self.wall_start = time.monotonic()
+
+    def __call__(self):
+        if self.realtime:
+            return self.start + time.monotonic() - self.wall_start
+        return self.now
+
+    def advance(self, timestamp):
+        if self.realtime:
+            delay = timestamp - self()
+            if delay > 0:
+                time.sleep(delay)
+        else:
+            self.now = timestamp
+
+
+class ReplayGrabber:
+    """Stands in for ScreenGrabber, decoding a session's frames in recorded order."""
+
+    def __init__(self, session):
+        self.data = session["data"]
+        self.frames = session["frames"]
+        self.index = 0
+        self.region = {"left": 0, "top": 0, "width": session["meta"]["width"], "height": session["meta"]["height"]}
+
+    def grab(self, frame):
+        offset, length = self.frames[self.index]
+        np.copyto(frame, cv2.imdecode(np.asarray(self.data[offset:offset + length]), cv2.IMREAD_COLOR))
+        self.index += 1
+        return frame
+
+    def close(self):
+        pass
+
+
+class ReplayBackend(main.InferenceBackend):
+    """Serves the detections recorded with a session, looked up by frame hash.
+
+    A frame the recording never inferred raises, so its click fails and is left out
+    of the replayed accuracy instead of being judged on made-up detections. latency
+    simulates a round trip so pipeline settings can be compared offline.
+    """
+
+    def __init__(self, detections, latency=0.0):
+        self.detections = detections
+        self.latency = latency
+        self.hasher = main.PredictionCache(0)
+        self.unrecorded = 0
+
+    def infer(self, frame):
+        if self.latency:
+            time.sleep(self.latency)
+        frame_hash = self.hasher.frame_hash(frame).hex()
+        predictions = self.detections.get(frame_hash)
+        if predictions is None:
+            self.unrecorded += 1
+            raise LookupError(f"frame {frame_hash} is not in the recording")
+        return predictions
+
+    def stats(self):
+        return {"unrecorded_frames": self.unrecorded}
+
+
+def replay_session(session, backend, realtime=False):
+    """Feed a recorded session through FrameProcessor and return what it measured.
+
+    Only clicks that were judged live are replayed. Their frames are the only ones
+    recorded around them, so the ring hands each click the same before and after
+    frames it was judged on live.
+    """
+    clock = ReplayClock(session["timestamps"][0] if len(session["timestamps"]) else 0.0, realtime)
+    # Unrecorded frames fail on purpose, so failures must not back off or open the breaker
+    governor = main.FrameRateGovernor(0, 0, float("inf"), 0, float("inf"), base_backoff=0)
+    processor = main.FrameProcessor(backend, grabber=ReplayGrabber(session), listen=False,
+                                    clock=clock, metrics=main.Metrics(True), governor=governor, click_queue_size=0)
+    processor.start_workers()
+    judged = [click["time"] for click in session["clicks"] if click["outcome"] in ("hit", "miss")]
+    clicks = deque(judged)
+
+    start = time.perf_counter()
+    for timestamp in session["timestamps"]:
+        clock.advance(timestamp)
+        # Clicks reach the processor between the frames they fell between, as they do live
+        while clicks and clicks[0] <= timestamp:
+            processor.record_click(clicks.popleft())
+        processor.capture_frame(timestamp)
+    while processor.busy():
+        time.sleep(0.005)
+    elapsed = time.perf_counter() - start
+    processor.stop()
+
+    meta = session["meta"]
+    recorded = meta["accurate_clicks"] / meta["total_clicks"] * 100 if meta["total_clicks"] else 100
+    replayed = processor.accurate_clicks / processor.total_clicks * 100 if processor.total_clicks else 100
+    snapshot = processor.metrics.snapshot()
+    if not realtime:
+        # Flat out, session time jumps with each frame fed, so click to verdict measures nothing
+        snapshot["stages"].pop("click_to_verdict", None)
+    return {
+        "frames": processor.captured,
+        "frames_per_second": processor.captured / elapsed if elapsed else 0.0,
+        "clicks": len(judged),
+        "clicks_not_judged_live": len(session["clicks"]) - len(judged),
+        "clicks_scored": processor.scored,
+        "clicks_left_out": processor.failed,
+        "clicks_unscored": processor.unscored,
+        "recorded_accuracy": recorded,
+        "replayed_accuracy": replayed,
+        "accuracy_delta": replayed - recorded,
+        **snapshot,
+        "pipeline": processor.pipeline_stats(),
+    }
+
+
+def synthesize_session(path, frames, width=640, height=360, interval=0.1, click_every=7, seed=0):
+    """Record a made-up session whose detections come from FakeBackend.
+
+    The scene changes every few frames, so some clicks land on a change and score
+    as hits. As live, only the frames each click is judged on are recorded, and the
+    recorded accuracy is what the click rule gives on them.
+    """
+    rng = np.random.default_rng(seed)
+    scenes = []
+    for i in range(0, frames, 5):
+        # New scene every five frames, its brightness decides how many objects FakeBackend sees
+        scenes.append(rng.integers(0, rng.integers(64, 256), (height, width, 3), dtype=np.uint8))
+
+    recorder = main.SessionRecorder(path, height, width)
+    backend = main.FakeBackend()
+    hasher = main.PredictionCache(0)
+    timestamps = np.arange(frames) * interval
+    total = accurate = 0
+    for i in range(1, frames, click_every):
+        click_time = i * interval + interval / 2
+        after = int(np.searchsorted(timestamps, click_time + main.CLICK_SETTLE))
+        if after >= frames:
+            break
+        counts = []
+        for index in (i, after):
+            frame = scenes[index // 5]
+            predictions = backend.infer(frame)
+            recorder.add_frame(frame, float(timestamps[index]))
+            recorder.add_detections(hasher.frame_hash(frame), predictions)
+            counts.append(len(predictions))
+        hit = counts[1] < counts[0]
+        recorder.add_click(click_time, "hit" if hit else "miss", float(timestamps[i]), float(timestamps[after]))
+        total += 1
+        accurate += hit
+    recorder.close(total, accurate)
+
+
+def bench_replay(session_path, synthetic, realtime, latency):
+    with tempfile.TemporaryDirectory() as temp_dir:
+        if synthetic:
+            session_path = os.path.join(temp_dir, "session")
+            synthesize_session(session_path, synthetic)
+        session = main.load_session(session_path)
+        results = replay_session(session, ReplayBackend(session["detections"], latency), realtime)
+        del session  # Let go of the memory maps before the temp dir is removed
+
+    print(f"frames          {results['frames']} at {results['frames_per_second']:.1f} frames/s")
+    print(f"clicks          {results['clicks_scored']} of {results['clicks']} judged live scored, "
+          f"{results['clicks_not_judged_live']} not judged live skipped, "
+          f"{results['clicks_left_out']} left out (frames not in recording), "
+          f"{results['clicks_unscored']} unscored (frames left the ring)")
+    print(f"accuracy        {results['replayed_accuracy']:.2f}% replayed, {results['recorded_accuracy']:.2f}% recorded, "
+          f"{results['accuracy_delta']:+.2f} delta")
+    for stage, timings in results["stages"].items():
+        print(f"{stage:<16}{timings['p50_ms']:8.2f} p50 {timings['p95_ms']:8.2f} p95 {timings['p99_ms']:8.2f} p99 ms")
+    print(f"counters        {results['counters']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="bench", required=True)
+    capture = subparsers.add_parser("capture", help="legacy capture path vs ScreenGrabber")
+    capture.add_argument("--frames", type=int, default=100)
+    capture.add_argument("--region", default=main.CAPTURE_REGION, help="WIDTHxHEIGHT, empty for full screen")
+    overlay = subparsers.add_parser("overlay", help="legacy accuracy draw vs AccuracyOverlay, headless by default")
+    overlay.add_argument("--draws", type=int, default=1000)
+    overlay.add_argument("--size", default="1920x1080", help="WIDTHxHEIGHT of the overlay window")
+    replay = subparsers.add_parser("replay", help="replay a recorded session through FrameProcessor")
+    replay.add_argument("session", nargs="?", help="dir a session was recorded into with RECORD_DIR")
+    replay.add_argument("--synthetic", type=int, metavar="FRAMES", help="replay a made-up session of this many frames")
+    replay.add_argument("--realtime", action="store_true", help="feed frames at recorded pace instead of flat out")
+    replay.add_argument("--latency", type=float, default=0.0, help="seconds each inference call takes")
+    args = parser.parse_args()
+
+    if args.bench == "capture":
+        bench_capture(args.frames, args.region)
+    elif args.bench == "overlay":
+        bench_overlay(args.draws, *(int(v) for v in args.size.split("x")))
+    elif args.bench == "replay":
+        if not args.session and not args.synthetic:
+            parser.error("replay needs a session dir or --synthetic")
+        bench_replay(args.session, args.synthetic, args.realtime, args.latency)
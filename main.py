@@ -4,14 +4,24 @@ import ctypes
 from mss import mss
 import cv2
 import numpy as np
-from threading import Thread
+from threading import Thread, Condition, Event, Lock, local
+from queue import Queue, Empty
+from concurrent.futures import Future, ThreadPoolExecutor
+from collections import deque, OrderedDict
+import heapq
+import hashlib
+import bisect
+import json
 import time
-from pynput import mouse, keyboard
-from inference_sdk import InferenceHTTPClient
+try:
+    from pynput import mouse, keyboard
+except ImportError:  # No input backend, e.g. headless Linux, which replays do not need
+    mouse = keyboard = None
+import requests
+import base64
 from dotenv import load_dotenv
 import logging
-from io import BytesIO
-from PIL import Image
+import ast
 
 
 # Load the API key from .env file located in the same directory as the executable
@@ -19,52 +29,915 @@ load_dotenv(os.path.join(os.path.dirname(__file__), '.env'))
 API_KEY = os.getenv("API_KEY")
 DEBUG = os.getenv("DEBUG")
 
-if not API_KEY:
-    logging.error("API_KEY not found in .env file.")
-    raise ValueError("API_KEY not found in .env file.")
-else:
-    logging.info("API_KEY loaded successfully")
+# Inference backend, all optional in .env
+INFERENCE_BACKEND = os.getenv("INFERENCE_BACKEND", "http")  # http, onnx or fake
+ONNX_MODEL = os.getenv("ONNX_MODEL", "valoaccuracy.onnx")  # Exported model, relative to the dir next to main.py
+BATCH_SIZE = int(os.getenv("BATCH_SIZE", "4"))  # Most frames the onnx backend runs in one batch
+BATCH_WAIT_MS = float(os.getenv("BATCH_WAIT_MS", "10"))  # How long the onnx backend waits to fill a batch
+INFERENCE_THREADS = int(os.getenv("INFERENCE_THREADS", "0"))  # ONNX Runtime CPU threads, 0 lets it decide
+CONFIDENCE = float(os.getenv("CONFIDENCE", "0.4"))  # Lowest score the onnx backend reports as a detection
+MODEL_INPUT_SIZE = int(os.getenv("MODEL_INPUT_SIZE", "640"))  # Longest side frames are shrunk to before upload
+JPEG_QUALITY = int(os.getenv("JPEG_QUALITY", "85"))  # Upload quality when the connection keeps up
+TARGET_RTT_MS = float(os.getenv("TARGET_RTT_MS", "300"))  # Round trip above which uploads get smaller
+
+# Pipeline tuning, all optional in .env
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "4"))  # Concurrent inference requests in flight
+CAPTURE_INTERVAL = float(os.getenv("CAPTURE_INTERVAL", "0.05"))  # Seconds between screen grabs while the mouse is in use
+IDLE_CAPTURE_INTERVAL = float(os.getenv("IDLE_CAPTURE_INTERVAL", "0.5"))  # Seconds between screen grabs once idle
+IDLE_AFTER = float(os.getenv("IDLE_AFTER", "3"))  # Seconds without mouse activity before capture slows down
+MAX_INFERENCES_PER_SECOND = float(os.getenv("MAX_INFERENCES_PER_SECOND", "0"))  # Request budget, 0 for none
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "3"))  # Failed calls in a row before inference pauses
+CAPTURE_REGION = os.getenv("CAPTURE_REGION", "")  # WIDTHxHEIGHT box centered on the crosshair, empty for full screen
+RING_SIZE = int(os.getenv("RING_SIZE", "8"))  # Recent frames kept to look up around a click
+CLICK_SETTLE = float(os.getenv("CLICK_SETTLE", "0.1"))  # Seconds after a click before the frame that judges it
+HASH_CACHE_SIZE = int(os.getenv("HASH_CACHE_SIZE", "64"))  # Recent frames whose predictions are kept
+RECORD_DIR = os.getenv("RECORD_DIR", "")  # Dir to record the session into for replay, empty turns recording off
+METRICS_FILE = os.getenv("METRICS_FILE", "")  # JSON lines file stage timings are appended to, empty turns metrics off
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "5"))  # Seconds between metrics lines
 
 # Set up logging to a file
 if DEBUG:
     logging.basicConfig(filename="app.log", level=logging.DEBUG, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Initialize pygame and set up the overlay window
-pygame.init()
-info = pygame.display.Info()
-screen_width, screen_height = info.current_w, info.current_h
-overlay = pygame.display.set_mode((screen_width, screen_height), pygame.NOFRAME | pygame.SRCALPHA)
-pygame.display.set_caption("Accuracy Overlay")
+overlay = None
+screen_width, screen_height = 0, 0
 
-# Set window to be transparent
-hwnd = pygame.display.get_wm_info()["window"]
-ctypes.windll.user32.SetWindowLongW(hwnd, -20, ctypes.windll.user32.GetWindowLongW(hwnd, -20) | 0x80000 | 0x20)
-ctypes.windll.user32.SetLayeredWindowAttributes(hwnd, 0x000000, 0, 0x2)
 
-if DEBUG:
-    logging.info("Overlay window created successfully")
+def check_api_key():
+    if not API_KEY:
+        logging.error("API_KEY not found in .env file.")
+        raise ValueError("API_KEY not found in .env file.")
+    else:
+        logging.info("API_KEY loaded successfully")
+
+
+def create_overlay():
+    global overlay, screen_width, screen_height
+
+    # Initialize pygame and set up the overlay window
+    pygame.init()
+    info = pygame.display.Info()
+    screen_width, screen_height = info.current_w, info.current_h
+    overlay = pygame.display.set_mode((screen_width, screen_height), pygame.NOFRAME | pygame.SRCALPHA)
+    pygame.display.set_caption("Accuracy Overlay")
+
+    # Set window to be transparent
+    hwnd = pygame.display.get_wm_info()["window"]
+    ctypes.windll.user32.SetWindowLongW(hwnd, -20, ctypes.windll.user32.GetWindowLongW(hwnd, -20) | 0x80000 | 0x20)
+    ctypes.windll.user32.SetLayeredWindowAttributes(hwnd, 0x000000, 0, 0x2)
+
+    if DEBUG:
+        logging.info("Overlay window created successfully")
+
+
+def capture_region(monitor, spec):
+    """Return the mss region for a WIDTHxHEIGHT box centered on the monitor, or the whole monitor."""
+    if not spec:
+        return dict(monitor)
+    width, height = (int(v) for v in spec.lower().split("x"))
+    width, height = min(width, monitor["width"]), min(height, monitor["height"])
+    return {
+        "left": monitor["left"] + (monitor["width"] - width) // 2,
+        "top": monitor["top"] + (monitor["height"] - height) // 2,
+        "width": width,
+        "height": height,
+    }
+
+
+class ScreenGrabber:
+    """Grabs the capture region straight into a caller-owned BGR frame.
+
+    One mss handle is kept for the life of the grabber and the raw BGRA buffer is
+    converted into the destination in a single cvtColor call, which is the layout
+    the inference backends take.
+    """
+
+    def __init__(self, region):
+        self.region = region
+        self.sct = None  # mss handles belong to the thread that opened them, so open on first grab
+
+    def grab(self, frame):
+        if self.sct is None:
+            self.sct = mss()
+        sct_img = self.sct.grab(self.region)
+        bgra = np.frombuffer(sct_img.raw, dtype=np.uint8).reshape(sct_img.height, sct_img.width, 4)
+        cv2.cvtColor(bgra, cv2.COLOR_BGRA2BGR, dst=frame)
+        return frame
+
+    def close(self):
+        if self.sct is not None:
+            self.sct.close()
+            self.sct = None
+
+
+class FrameRing:
+    """Fixed-size ring of timestamped frames backed by one preallocated array.
+
+    Capture writes each grab into slot() and then commit()s its timestamp. Empty
+    slots have a timestamp of -inf so they never match a lookup.
+    """
+
+    def __init__(self, size, height, width):
+        self.frames = np.empty((size, height, width, 3), dtype=np.uint8)
+        self.timestamps = np.full(size, -np.inf)
+        self.head = 0  # Slot the next grab is written into
+        self.latest = -np.inf
+
+    def slot(self):
+        return self.frames[self.head]
+
+    def commit(self, timestamp):
+        self.timestamps[self.head] = timestamp
+        self.latest = timestamp
+        self.head = (self.head + 1) % len(self.timestamps)
+
+    def before(self, timestamp):
+        """Slot of the newest frame taken at or before timestamp, or None."""
+        candidates = np.where(self.timestamps <= timestamp, self.timestamps, -np.inf)
+        index = int(np.argmax(candidates))
+        return index if np.isfinite(candidates[index]) else None
+
+    def after(self, timestamp):
+        """Slot of the oldest frame taken at or after timestamp, or None."""
+        candidates = np.where(self.timestamps >= timestamp, self.timestamps, np.inf)
+        index = int(np.argmin(candidates))
+        return index if np.isfinite(candidates[index]) else None
+
+    def copy(self, index):
+        # Copied out so the slot can be overwritten while the frame waits on inference
+        return self.frames[index].copy()
+
+
+class Histogram:
+    """Latency histogram with fixed log-spaced buckets, so memory never grows.
+
+    Buckets run from 0.1 ms to about a minute, each 25% wider than the last, which
+    keeps percentiles within 25% of the true value.
+    """
+
+    BOUNDS = [0.0001 * 1.25 ** i for i in range(60)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BOUNDS) + 1)
+        self.total = 0
+        self.max = 0.0
+
+    def record(self, seconds):
+        self.counts[bisect.bisect_left(self.BOUNDS, seconds)] += 1
+        self.total += 1
+        self.max = max(self.max, seconds)
+
+    def percentile(self, fraction):
+        """Upper bound in seconds of the bucket holding the given fraction of samples, capped at the max seen."""
+        target = fraction * self.total
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if count and seen >= target:
+                return min(self.BOUNDS[i], self.max) if i < len(self.BOUNDS) else self.max
+        return 0.0
+
+
+class Metrics:
+    """Stage timings and counters that are cheap enough to leave in the hot loop.
+
+    Time a stage with observe(stage, metrics.start()). When metrics are disabled
+    every method returns straight away.
+    """
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.lock = Lock()
+        self.histograms = {}
+        self.counters = {}
+
+    def start(self):
+        return time.perf_counter() if self.enabled else 0.0
+
+    def observe(self, stage, start):
+        if self.enabled:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage, seconds):
+        if not self.enabled:
+            return
+        with self.lock:
+            histogram = self.histograms.get(stage)
+            if histogram is None:
+                histogram = self.histograms[stage] = Histogram()
+            histogram.record(seconds)
+
+    def count(self, name, amount=1):
+        if not self.enabled:
+            return
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + amount
+
+    def snapshot(self):
+        with self.lock:
+            stages = {
+                stage: {
+                    "count": histogram.total,
+                    "p50_ms": round(histogram.percentile(0.50) * 1000, 2),
+                    "p95_ms": round(histogram.percentile(0.95) * 1000, 2),
+                    "p99_ms": round(histogram.percentile(0.99) * 1000, 2),
+                    "max_ms": round(histogram.max * 1000, 2),
+                }
+                for stage, histogram in self.histograms.items()
+            }
+            return {"counters": dict(self.counters), "stages": stages}
+
+
+class StageQueue:
+    """Queue between two pipeline stages, bounded when maxsize is set.
+
+    When the queue is full the oldest item is dropped to make room and handed to
+    on_drop, so a slow consumer works on the newest items instead of a growing
+    backlog. dropped counts them for pipeline_stats().
+    """
+
+    def __init__(self, maxsize=0, on_drop=None):
+        self.maxsize = maxsize
+        self.on_drop = on_drop
+        self.items = deque()
+        self.dropped = 0
+        self.cond = Condition()
+
+    def put(self, item):
+        with self.cond:
+            if self.maxsize and len(self.items) >= self.maxsize:
+                stale = self.items.popleft()
+                self.dropped += 1
+                if self.on_drop:
+                    self.on_drop(stale)
+            self.items.append(item)
+            self.cond.notify()
+
+    def get(self, timeout=None):
+        with self.cond:
+            if not self.items:
+                self.cond.wait(timeout)
+            if not self.items:
+                return None
+            return self.items.popleft()
+
+    def depth(self):
+        return len(self.items)
+
+
+class PredictionCache:
+    """LRU of predictions keyed by a digest of the exact frame contents.
+
+    Only byte-identical frames share an entry, e.g. a static menu or a before and
+    after frame where nothing on screen moved. A near match is never reused, since
+    the few pixels of a target disappearing are exactly what decides a click, so
+    there is no downsampled or perceptual change detector and no threshold to tune.
+    Live game frames rarely repeat exactly, expect hits mostly on menus and pauses.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self.cache = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def frame_hash(self, frame):
+        return hashlib.blake2b(np.ascontiguousarray(frame), digest_size=16).digest()
+
+    def lookup(self, frame_hash):
+        with self.lock:
+            predictions = self.cache.get(frame_hash)
+            if predictions is None:
+                self.misses += 1
+                return None
+            self.cache.move_to_end(frame_hash)
+            self.hits += 1
+            return predictions
+
+    def store(self, frame_hash, predictions):
+        with self.lock:
+            self.cache[frame_hash] = predictions
+            self.cache.move_to_end(frame_hash)
+            if len(self.cache) > self.size:
+                self.cache.popitem(last=False)
+
+
+class SessionRecorder:
+    """Records a session so it can be replayed without a screen, input hooks or the API.
+
+    Only the frames a click was judged on are kept, as lossless PNGs so their hashes
+    still match the recorded detections. A session dir holds frames.bin with the
+    PNGs back to back, frames.jsonl with each frame's timestamp, offset and length,
+    clicks.jsonl with each click's timestamp, outcome (hit, miss, failed, dropped,
+    unscored or waiting) and the timestamps of the frames it was judged on, and on
+    close detections.json (predictions keyed by frame hash) and meta.json. Files
+    grow as the session does.
+    """
+
+    def __init__(self, path, height, width):
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.height = height
+        self.width = width
+        self.frames = open(os.path.join(path, "frames.bin"), "wb")
+        self.index = open(os.path.join(path, "frames.jsonl"), "w")
+        self.clicks = open(os.path.join(path, "clicks.jsonl"), "w")
+        self.detections = {}
+        self.recorded = set()  # Timestamps already written, neighbouring clicks share frames
+        self.lock = Lock()
+        self.size = 0
+
+    def add_frame(self, frame, timestamp):
+        with self.lock:
+            if timestamp in self.recorded:
+                return
+            self.recorded.add(timestamp)
+        # Encoded outside the lock, fastest compression since this runs on an inference worker
+        _, png = cv2.imencode(".png", frame, [cv2.IMWRITE_PNG_COMPRESSION, 1])
+        with self.lock:
+            self.frames.write(png.tobytes())
+            self.index.write(json.dumps({"time": timestamp, "offset": self.size, "length": len(png)}) + "\n")
+            self.size += len(png)
+
+    def add_click(self, timestamp, outcome, before=None, after=None):
+        line = json.dumps({"time": timestamp, "outcome": outcome, "before": before, "after": after})
+        with self.lock:
+            self.clicks.write(line + "\n")
+
+    def add_detections(self, frame_hash, predictions):
+        with self.lock:
+            self.detections[frame_hash.hex()] = predictions
+
+    def close(self, total_clicks, accurate_clicks):
+        self.frames.close()
+        self.index.close()
+        self.clicks.close()
+        with open(os.path.join(self.path, "detections.json"), "w") as detections_file:
+            json.dump(self.detections, detections_file)
+        meta = {
+            "frames": len(self.recorded),
+            "height": self.height,
+            "width": self.width,
+            "total_clicks": total_clicks,
+            "accurate_clicks": accurate_clicks,
+        }
+        with open(os.path.join(self.path, "meta.json"), "w") as meta_file:
+            json.dump(meta, meta_file)
+
+
+def load_session(path):
+    """Open a recorded session, frames stay on disk as PNGs and are paged in as they are read."""
+    with open(os.path.join(path, "meta.json")) as meta_file:
+        meta = json.load(meta_file)
+    with open(os.path.join(path, "clicks.jsonl")) as clicks_file:
+        # Clicks are written as they are settled, which is not always in click order
+        clicks = sorted((json.loads(line) for line in clicks_file if line.strip()), key=lambda click: click["time"])
+    with open(os.path.join(path, "frames.jsonl")) as index_file:
+        # Workers record frames as they finish, so the file is not in time order
+        index = sorted((json.loads(line) for line in index_file if line.strip()), key=lambda entry: entry["time"])
+    with open(os.path.join(path, "detections.json")) as detections_file:
+        detections = json.load(detections_file)
+    frames_path = os.path.join(path, "frames.bin")
+    # np.memmap cannot map an empty file, which a session without clicks leaves
+    data = np.memmap(frames_path, dtype=np.uint8, mode="r") if os.path.getsize(frames_path) else np.empty(0, np.uint8)
+    return {
+        "meta": meta,
+        "data": data,
+        "frames": [(entry["offset"], entry["length"]) for entry in index],
+        "timestamps": np.array([entry["time"] for entry in index]),
+        "clicks": clicks,
+        "detections": detections,
+    }
+
+
+class InferenceBackend:
+    """Turns BGR frames into Roboflow style prediction lists."""
+
+    def infer(self, frame):
+        raise NotImplementedError
+
+    def infer_batch(self, frames):
+        return [self.infer(frame) for frame in frames]
+
+    def stats(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+class HTTPTransport:
+    """Uploads frames to the hosted model as JPEGs over pooled keep-alive connections.
+
+    Frames are shrunk to the model input size in a buffer reused per worker thread
+    and encoded with cv2. While the smoothed round trip is over target_rtt the JPEG
+    quality steps down, then the resolution. Both step back up once there is room.
+    """
+
+    MIN_QUALITY = 50
+    MIN_SCALE = 0.5
+    ADAPT_EVERY = 5  # Frames between adjustments so the average can settle
+
+    def __init__(self, api_url, api_key, model_id, input_size, quality, target_rtt, pool_size):
+        self.url = f"{api_url.rstrip('/')}/{model_id}"
+        self.params = {"api_key": api_key}
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+        self.input_size = input_size
+        self.max_quality = quality
+        self.quality = quality
+        self.scale = 1.0
+        self.target_rtt = target_rtt
+        self.rtt = None  # Exponentially smoothed round trip in seconds
+        self.buffers = local()
+
+        self.lock = Lock()
+        self.frames_sent = 0
+        self.bytes_sent = 0
+        self.encode_time = 0.0
+
+    def encode(self, frame):
+        """Return (jpeg, factor) where factor is the upload size over the frame size."""
+        height, width = frame.shape[:2]
+        factor = min(1.0, self.input_size * self.scale / max(width, height))
+        size = (round(width * factor), round(height * factor))
+        buffer = getattr(self.buffers, "resized", None)
+        if buffer is None or buffer.shape[:2] != (size[1], size[0]):
+            buffer = self.buffers.resized = np.empty((size[1], size[0], 3), dtype=np.uint8)
+        cv2.resize(frame, size, dst=buffer, interpolation=cv2.INTER_AREA)
+        _, jpeg = cv2.imencode(".jpg", buffer, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        return jpeg, factor
+
+    def infer(self, frame):
+        start = time.perf_counter()
+        jpeg, factor = self.encode(frame)
+        body = base64.b64encode(jpeg)  # The hosted API takes the image as a base64 body
+        encoded = time.perf_counter()
+
+        response = self.session.post(self.url, params=self.params, data=body, timeout=10,
+                                     headers={"Content-Type": "application/x-www-form-urlencoded"})
+        response.raise_for_status()
+        self.adapt(time.perf_counter() - encoded, len(body), encoded - start)
+
+        # Predictions come back in upload pixels, map them back onto the frame
+        predictions = response.json()['predictions']
+        for prediction in predictions:
+            for key in ("x", "y", "width", "height"):
+                prediction[key] /= factor
+        return predictions
+
+    def adapt(self, rtt, body_size, encode_time):
+        # Counted under the same lock as the adjustment so every ADAPT_EVERY-th frame adjusts exactly once
+        with self.lock:
+            self.frames_sent += 1
+            self.bytes_sent += body_size
+            self.encode_time += encode_time
+            self.rtt = rtt if self.rtt is None else 0.8 * self.rtt + 0.2 * rtt
+            if self.frames_sent % self.ADAPT_EVERY:
+                return
+            if self.rtt > self.target_rtt:
+                if self.quality > self.MIN_QUALITY:
+                    self.quality = max(self.MIN_QUALITY, self.quality - 10)
+                else:
+                    self.scale = max(self.MIN_SCALE, self.scale * 0.8)
+            elif self.rtt < 0.7 * self.target_rtt:
+                if self.scale < 1.0:
+                    self.scale = min(1.0, self.scale / 0.8)
+                else:
+                    self.quality = min(self.max_quality, self.quality + 5)
+
+    def stats(self):
+        sent = max(self.frames_sent, 1)
+        return {
+            "frames_sent": self.frames_sent,
+            "bytes_per_frame": self.bytes_sent // sent,
+            "encode_ms": round(self.encode_time / sent * 1000, 2),
+            "rtt_ms": round(self.rtt * 1000, 1) if self.rtt is not None else None,
+            "jpeg_quality": self.quality,
+            "upload_scale": round(self.scale, 2),
+        }
+
+    def close(self):
+        self.session.close()
+
+
+class HTTPBackend(InferenceBackend):
+    """Hosted model behind the Roboflow inference API.
+
+    The frames of a batch are posted at once, so a click waits one round trip
+    rather than one per frame.
+    """
 
-class FrameProcessor:
     def __init__(self, api_url, api_key, model_id):
-        self.client = InferenceHTTPClient(api_url=api_url, api_key=api_key)
-        self.model_id = model_id
-        self.monitor = mss().monitors[1]  # Index 1 is the main screen
+        # Each worker posts up to two frames at once, one from its own thread and one from the pool
+        self.transport = HTTPTransport(api_url, api_key, model_id, MODEL_INPUT_SIZE, JPEG_QUALITY,
+                                       TARGET_RTT_MS / 1000, INFERENCE_WORKERS * 2)
+        self.uploads = ThreadPoolExecutor(INFERENCE_WORKERS, thread_name_prefix="upload")
+
+    def infer(self, frame):
+        return self.transport.infer(frame)
+
+    def infer_batch(self, frames):
+        if not frames:
+            return []
+        futures = [self.uploads.submit(self.transport.infer, frame) for frame in frames[1:]]
+        return [self.transport.infer(frames[0]), *(future.result() for future in futures)]
+
+    def stats(self):
+        return self.transport.stats()
+
+    def close(self):
+        self.uploads.shutdown()
+        self.transport.close()
+
+
+class OnnxBackend(InferenceBackend):
+    """Exported YOLOv8 model run locally on the CPU with ONNX Runtime.
+
+    Frames from all inference workers go through one batching thread, which runs
+    whatever arrived within batch_wait seconds (up to batch_size frames) as one
+    session call.
+    """
+
+    def __init__(self, model_path, batch_size, batch_wait, threads, confidence):
+        import onnxruntime
+
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = onnxruntime.InferenceSession(model_path, options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        batch_dim, _, height, width = model_input.shape
+        self.input_size = (width if isinstance(width, int) else 640, height if isinstance(height, int) else 640)
+        # Models exported with a fixed batch of 1 cannot take stacked frames
+        self.batch_size = batch_size if not isinstance(batch_dim, int) else min(batch_size, batch_dim)
+        self.batch_wait = batch_wait
+        self.confidence = confidence
+        names = self.session.get_modelmeta().custom_metadata_map.get("names")
+        self.class_names = ast.literal_eval(names) if names else {}
+
+        self.requests = Queue()
+        self.closed = False
+        self.batches = 0
+        self.batched_frames = 0
+        self.thread = Thread(target=self.run_batches, name="onnx-batcher", daemon=True)
+        self.thread.start()
+        if DEBUG:
+            logging.info("Loaded %s with input %s, batching up to %d", model_path, self.input_size, self.batch_size)
+
+    def infer(self, frame):
+        return self.infer_batch([frame])[0]
+
+    def infer_batch(self, frames):
+        futures = []
+        for frame in frames:
+            future = Future()
+            self.requests.put((frame, future))
+            futures.append(future)
+        return [future.result() for future in futures]
+
+    def run_batches(self):
+        while not self.closed:
+            try:
+                batch = [self.requests.get(timeout=0.1)]
+            except Empty:
+                continue
+            deadline = time.monotonic() + self.batch_wait
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.requests.get(timeout=max(0, deadline - time.monotonic())))
+                except Empty:
+                    break
+
+            try:
+                results = self.run_session([frame for frame, _ in batch])
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            for (_, future), predictions in zip(batch, results):
+                future.set_result(predictions)
+            self.batches += 1
+            self.batched_frames += len(batch)
+
+    def letterbox(self, frame, padded):
+        """Fit frame into padded without stretching it, grey bars fill the rest.
+
+        Returns (scale, pad_x, pad_y), which decode() needs to map boxes back.
+        """
+        height, width = frame.shape[:2]
+        input_width, input_height = self.input_size
+        scale = min(input_width / width, input_height / height)
+        resized_width, resized_height = round(width * scale), round(height * scale)
+        pad_x, pad_y = (input_width - resized_width) // 2, (input_height - resized_height) // 2
+        padded[:] = 114  # The grey YOLOv8 pads with in training
+        padded[pad_y:pad_y + resized_height, pad_x:pad_x + resized_width] = cv2.resize(
+            frame, (resized_width, resized_height), interpolation=cv2.INTER_LINEAR)
+        return scale, pad_x, pad_y
+
+    def run_session(self, frames):
+        input_width, input_height = self.input_size
+        batch = np.empty((len(frames), input_height, input_width, 3), dtype=np.uint8)
+        transforms = [self.letterbox(frame, padded) for frame, padded in zip(frames, batch)]
+        blob = batch[..., ::-1].transpose(0, 3, 1, 2).astype(np.float32) / 255.0  # BGR HWC -> RGB CHW
+        outputs = self.session.run(None, {self.input_name: blob})[0]
+        return [self.decode(output, *transform) for output, transform in zip(outputs, transforms)]
+
+    def decode(self, output, scale, pad_x, pad_y):
+        # YOLOv8 output is (4 + classes, anchors) with boxes as centre x, centre y, width, height
+        rows = output.T
+        scores = rows[:, 4:]
+        class_ids = scores.argmax(axis=1)
+        confidences = scores[np.arange(len(rows)), class_ids]
+        keep = confidences >= self.confidence
+        rows, class_ids, confidences = rows[keep], class_ids[keep], confidences[keep]
+        if not len(rows):
+            return []
+
+        # Undo the letterbox so boxes are in frame pixels
+        boxes = (rows[:, :4] - np.array([pad_x, pad_y, 0, 0], dtype=np.float32)) / scale
+        corners = np.column_stack([boxes[:, 0] - boxes[:, 2] / 2, boxes[:, 1] - boxes[:, 3] / 2, boxes[:, 2], boxes[:, 3]])
+        indices = cv2.dnn.NMSBoxes(corners.tolist(), confidences.tolist(), self.confidence, 0.5)
+
+        predictions = []
+        for i in np.array(indices).flatten():
+            x, y, width, height = boxes[i].tolist()
+            class_id = int(class_ids[i])
+            predictions.append({
+                "x": x,
+                "y": y,
+                "width": width,
+                "height": height,
+                "confidence": float(confidences[i]),
+                "class_id": class_id,
+                "class": self.class_names.get(class_id, str(class_id)),
+            })
+        return predictions
+
+    def stats(self):
+        return {"batches": self.batches, "frames_per_batch": round(self.batched_frames / max(self.batches, 1), 2)}
+
+    def close(self):
+        self.closed = True
+        self.thread.join()
+
+
+class FakeBackend(InferenceBackend):
+    """Deterministic stand-in for tests and offline runs.
+
+    The number of objects is taken from the frame's mean brightness, so the same
+    frame always gives the same predictions. latency simulates a round trip.
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def infer(self, frame):
+        if self.latency:
+            time.sleep(self.latency)
+        count = int(frame.mean()) % 4
+        return [
+            {"x": 10.0 + 20 * i, "y": 10.0, "width": 10.0, "height": 10.0, "confidence": 1.0, "class_id": 0, "class": "enemy"}
+            for i in range(count)
+        ]
+
+
+def create_backend(name, api_url, api_key, model_id):
+    if name == "http":
+        return HTTPBackend(api_url, api_key, model_id)
+    if name == "onnx":
+        model_path = os.path.join(os.path.dirname(__file__), ONNX_MODEL)
+        return OnnxBackend(model_path, BATCH_SIZE, BATCH_WAIT_MS / 1000, INFERENCE_THREADS, CONFIDENCE)
+    if name == "fake":
+        return FakeBackend()
+    logging.error("Unknown INFERENCE_BACKEND %r in .env file.", name)
+    raise ValueError(f"Unknown INFERENCE_BACKEND {name!r} in .env file.")
+
+
+class AccuracyOverlay:
+    """Accuracy readout on the overlay window, drawn from the main thread.
+
+    The font and the surface for each character are made once and reused. The
+    screen is only touched when the text changes, and then only where the old and
+    new text sit.
+    """
+
+    def __init__(self, surface, position):
+        self.surface = surface
+        self.position = position
+        self.font = pygame.font.SysFont("Arial", 30)
+        self.glyphs = {}
+        self.text = None
+        self.rect = None
+
+    def glyph(self, char):
+        glyph = self.glyphs.get(char)
+        if glyph is None:
+            glyph = self.glyphs[char] = self.font.render(char, True, (0, 255, 0))
+        return glyph
+
+    def show(self, accuracy):
+        accuracy_text = f"Accuracy: {accuracy:.2f}%"
+        if accuracy_text == self.text:
+            return
+
+        dirty = []
+        if self.rect is not None:
+            self.surface.fill((0, 0, 0, 0), self.rect)  # Clear the old text
+            dirty.append(self.rect)
+        x, y = self.position
+        rect = pygame.Rect(x, y, 0, 0)
+        for char in accuracy_text:
+            rect.union_ip(self.surface.blit(self.glyph(char), (x, y)))
+            x += self.glyphs[char].get_width()
+        dirty.append(rect)
+        pygame.display.update(dirty)
+        self.text = accuracy_text
+        self.rect = rect
+
+
+class FrameRateGovernor:
+    """Decides how often to capture and when inference may be called.
+
+    Capture runs at active_interval while the mouse is in use and drops to
+    idle_interval after idle_after seconds without activity. Failed inference
+    calls back off exponentially. After failure_threshold failures in a row the
+    breaker opens and nothing is sent until the backoff runs out, then one trial
+    call decides whether it closes again. max_rate caps calls per second with a
+    token bucket. Everything reads time from clock so tests can drive it.
+
+    Capture waits on wake between frames, so activity after an idle spell gets a
+    frame straight away instead of at the end of the idle interval.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, active_interval, idle_interval, idle_after, max_rate, failure_threshold,
+                 base_backoff=0.5, max_backoff=30.0, clock=time.monotonic):
+        self.active_interval = active_interval
+        self.idle_interval = idle_interval
+        self.idle_after = idle_after
+        self.max_rate = max_rate
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self.clock = clock
+        self.lock = Lock()
+
+        self.last_activity = -np.inf
+        self.wake = Event()
+        self.state = self.CLOSED
+        self.failures = 0
+        self.retry_at = -np.inf
+        self.trial_in_flight = False
+        self.opened = 0
+        # A click can need two calls at once, so the bucket always holds at least two
+        self.capacity = max(max_rate, 2.0)
+        self.tokens = self.capacity
+        self.refilled = clock()
+
+    def note_activity(self):
+        was_idle = self.idle
+        self.last_activity = self.clock()
+        if was_idle:
+            self.wake.set()
+
+    @property
+    def idle(self):
+        return self.clock() - self.last_activity >= self.idle_after
+
+    def capture_interval(self):
+        return self.idle_interval if self.idle else self.active_interval
+
+    def inference_delay(self, calls=1):
+        """Seconds to wait before making calls, 0 means go ahead and they are charged to the budget."""
+        with self.lock:
+            now = self.clock()
+            if now < self.retry_at:
+                return self.retry_at - now
+            if self.state == self.OPEN:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and self.trial_in_flight:
+                return self.base_backoff  # Let the trial call decide first
+
+            if self.max_rate:
+                self.tokens = min(self.capacity, self.tokens + (now - self.refilled) * self.max_rate)
+                self.refilled = now
+                if self.tokens < calls:
+                    return (calls - self.tokens) / self.max_rate
+                self.tokens -= calls
+
+            if self.state == self.HALF_OPEN:
+                self.trial_in_flight = True
+            return 0.0
+
+    def record_success(self):
+        with self.lock:
+            self.state = self.CLOSED
+            self.failures = 0
+            self.retry_at = -np.inf
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.retry_at = self.clock() + min(self.max_backoff, self.base_backoff * 2 ** (self.failures - 1))
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.opened += 1
+                self.state = self.OPEN
+            self.trial_in_flight = False
+
+    def stats(self):
+        return {
+            "scheduler_state": self.state,
+            "scheduler_idle": self.idle,
+            "capture_interval": self.capture_interval(),
+            "inference_failures": self.failures,
+            "breaker_opened": self.opened,
+            "backoff_remaining": round(max(0.0, self.retry_at - self.clock()), 2),
+        }
+
+
+class FrameProcessor:
+    """Judges clicks from screen frames.
+
+    Everything that touches the machine can be swapped out, which is how replays
+    run: grabber stands in for the screen, listen=False leaves the input hooks off
+    and clock supplies the timestamps given to frames and clicks. click_queue_size
+    caps the clicks waiting on inference, 0 never drops one.
+    """
+
+    def __init__(self, backend, grabber=None, listen=True, clock=time.monotonic, metrics=None, governor=None,
+                 click_queue_size=None):
+        self.backend = backend
+        self.metrics = metrics or Metrics(bool(METRICS_FILE))
+        self.clock = clock
+        self.governor = governor or FrameRateGovernor(CAPTURE_INTERVAL, IDLE_CAPTURE_INTERVAL, IDLE_AFTER,
+                                                      MAX_INFERENCES_PER_SECOND, BREAKER_FAILURES)
+        if grabber is None:
+            with mss() as sct:
+                monitor = sct.monitors[1]  # Index 1 is the main screen
+            grabber = ScreenGrabber(capture_region(monitor, CAPTURE_REGION))
+        self.grabber = grabber
+        self.region = grabber.region
+        self.ring = FrameRing(RING_SIZE, self.region["height"], self.region["width"])
+        self.recorder = None
+        if RECORD_DIR:
+            self.recorder = SessionRecorder(RECORD_DIR, self.region["height"], self.region["width"])
         self.stop_thread = False
-        self.mouse_listener = mouse.Listener(on_click=self.on_click)
-        self.keyboard_listener = keyboard.Listener(on_press=self.on_key_press, on_release=self.on_key_release)
+        self.listeners = []
+        if listen:
+            self.listeners = [
+                mouse.Listener(on_move=self.on_move, on_click=self.on_click),
+                keyboard.Listener(on_press=self.on_key_press, on_release=self.on_key_release),
+            ]
         self.quit_keys_pressed = False
         self.ctrl_pressed = False
         self.alt_pressed = False
-        self.mouse_clicked = False
+        self.clicks = deque()  # Timestamps of clicks waiting for their after frame
         self.total_clicks = 0
         self.accurate_clicks = 0
+        self.prediction_cache = PredictionCache(HASH_CACHE_SIZE)
+
+        # Capture -> inference workers -> ordered scoring, one job per click
+        self.results = StageQueue()
+        # Every queued click holds two full frames, so while inference is down or throttled the
+        # backlog is capped and the oldest click is dropped rather than memory growing without end
+        if click_queue_size is None:
+            click_queue_size = 2 * INFERENCE_WORKERS
+        self.jobs = StageQueue(click_queue_size, on_drop=self.on_click_dropped)
+        self.stats_lock = Lock()
+        self.captured = 0
+        self.dispatched = 0
+        self.unscored = 0
+        self.failed = 0
+        self.in_flight = 0
+        self.scored = 0
+        self.threads = []
+        self.accuracy_updates = Queue()  # Drawn by the main loop, pygame is not safe to use from here
 
     def on_click(self, x, y, button, pressed):
         if button == mouse.Button.left and pressed:
-            self.mouse_clicked = True
+            self.record_click(self.clock())
             if DEBUG:
                 logging.info("Mouse clicked at (%d, %d)", x, y)
 
+    def on_move(self, x, y):
+        self.governor.note_activity()
+
+    def record_click(self, timestamp):
+        self.governor.note_activity()
+        self.clicks.append(timestamp)
+        self.metrics.count("clicks")
+
     def on_key_press(self, key):
         if key == keyboard.Key.ctrl_l or key == keyboard.Key.ctrl_r:
             self.ctrl_pressed = True
@@ -82,78 +955,255 @@ class FrameProcessor:
             self.alt_pressed = False
 
     def start(self):
-        self.mouse_listener.start()
-        self.keyboard_listener.start()
-        self.thread = Thread(target=self.capture_and_process_frames)
-        self.thread.start()
+        for listener in self.listeners:
+            listener.start()
+        self.start_workers()
+        capture = Thread(target=self.capture_frames, name="capture")
+        capture.start()
+        self.threads.append(capture)
         if DEBUG:
-                logging.info("FrameProcessor started")
+            logging.info("FrameProcessor started with %d inference workers", INFERENCE_WORKERS)
 
-    def capture_and_process_frames(self):
-        last_obj_count = 0
+    def start_workers(self):
+        # Everything after capture, replays feed frames in through capture_frame() themselves
+        threads = [Thread(target=self.run_inference, name=f"inference-{i}") for i in range(INFERENCE_WORKERS)]
+        threads.append(Thread(target=self.score_results, name="scoring"))
+        if METRICS_FILE:
+            threads.append(Thread(target=self.export_metrics, name="metrics"))
+        for thread in threads:
+            thread.start()
+        self.threads += threads
 
-        while not self.stop_thread and not self.quit_keys_pressed:
-            with mss() as sct:
-                sct_img = sct.grab(self.monitor)
-                frame = cv2.cvtColor(np.array(sct_img), cv2.COLOR_BGRA2BGR)
+    @property
+    def running(self):
+        return not self.stop_thread and not self.quit_keys_pressed
 
-                # Convert the frame to a PIL image
-                pil_img = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+    def capture_frames(self):
+        while self.running:
+            self.capture_frame(self.clock())
+            # Fast while the mouse is in use, slow when idle, cut short when activity resumes or on stop
+            self.governor.wake.wait(self.governor.capture_interval())
+            self.governor.wake.clear()
 
-                # Run the AI model from Roboflow
-                try:
-                    result = self.client.infer(pil_img, model_id=self.model_id)
-                    detections = result['predictions']
-                    current_obj_count = len(detections)
-                    if DEBUG:
-                        logging.debug("Current object count: %d", current_obj_count)
-                except Exception as e:
-                    if DEBUG:
-                        logging.error("Error running inference: %s", e)
-                    current_obj_count = 0
-
-            if self.mouse_clicked:
-                self.total_clicks += 1
-                if current_obj_count < last_obj_count:
-                    self.accurate_clicks += 1
-                self.mouse_clicked = False
+        self.grabber.close()
+
+    def capture_frame(self, timestamp):
+        start = self.metrics.start()
+        self.grabber.grab(self.ring.slot())
+        self.ring.commit(timestamp)
+        self.metrics.observe("capture", start)
+        self.captured += 1
+        self.metrics.count("frames")
+        self.dispatch_clicks()
 
-            last_obj_count = current_obj_count
+    def dispatch_clicks(self):
+        # A click can be judged once the ring holds a frame from after its settle delay
+        while self.clicks and self.ring.latest >= self.clicks[0] + CLICK_SETTLE:
+            click_time = self.clicks.popleft()
+            before = self.ring.before(click_time)
+            after = self.ring.after(click_time + CLICK_SETTLE)
+            if before is None or after is None:
+                self.unscored += 1  # The frames around this click have already left the ring
+                if self.recorder is not None:
+                    self.recorder.add_click(click_time, "unscored")
+                continue
+            frame_times = (float(self.ring.timestamps[before]), float(self.ring.timestamps[after]))
+            self.jobs.put((self.dispatched, click_time, self.ring.copy(before), self.ring.copy(after), frame_times))
+            self.dispatched += 1
 
-            # Calculate and display accuracy on the screen
-            accuracy = (self.accurate_clicks / self.total_clicks) * 100 if self.total_clicks > 0 else 100
-            self.display_accuracy(accuracy)
+    def on_click_dropped(self, job):
+        # The scorer waits for every seq in order, so a dropped click still gets a (verdictless) result
+        seq, click_time, _, _, frame_times = job
+        self.metrics.count("dropped_clicks")
+        if self.recorder is not None:
+            self.recorder.add_click(click_time, "dropped", *frame_times)
+        self.results.put((seq, click_time, None, None, frame_times))
 
-            time.sleep(0.1)  # Small delay to avoid high CPU usage
+    def busy(self):
+        """True while a dispatched click has not been scored, failed or dropped yet."""
+        return self.scored + self.failed + self.jobs.dropped < self.dispatched
+
+    def run_inference(self):
+        while self.running:
+            item = self.jobs.get(timeout=0.1)
+            if item is None:
+                continue
+            seq, click_time, before, after, frame_times = item
+
+            with self.stats_lock:
+                self.in_flight += 1
+            if self.recorder is not None:
+                # Recorded here rather than on capture, only frames a click is judged on are kept
+                for frame, timestamp in zip((before, after), frame_times):
+                    self.recorder.add_frame(frame, timestamp)
+
+            # Both frames always get predictions, only an exact repeat is served from cache
+            predictions = self.predict([before, after])
+
+            with self.stats_lock:
+                self.in_flight -= 1
+                if predictions is None:
+                    self.failed += 1  # Inference failed, leave the click out rather than call it a miss
+            if predictions is None and self.recorder is not None:
+                self.recorder.add_click(click_time, "failed", *frame_times)
+            before_predictions, after_predictions = predictions or (None, None)
+            self.results.put((seq, click_time, before_predictions, after_predictions, frame_times))
+
+    def predict(self, frames):
+        """Return predictions for each frame, or None when inference failed or was stopped."""
+        start = self.metrics.start()
+        hashes = [self.prediction_cache.frame_hash(frame) for frame in frames]
+        predictions = [self.prediction_cache.lookup(frame_hash) for frame_hash in hashes]
+        self.metrics.observe("hashing", start)
+        # Identical frames in one request are only sent once
+        missing = [i for i, cached in enumerate(predictions) if cached is None and hashes[i] not in hashes[:i]]
+        self.metrics.count("skips", len(frames) - len(missing))
+        if not missing:
+            return predictions
+
+        # Wait out any backoff or request budget before calling
+        while True:
+            if not self.running:
+                return None
+            delay = self.governor.inference_delay(len(missing))
+            if not delay:
+                break
+            self.metrics.count("throttled")
+            time.sleep(min(delay, 0.1))
+
+        # Run the AI model, frames of one click go together so the backend can batch them
+        start = self.metrics.start()
+        try:
+            results = self.backend.infer_batch([frames[i] for i in missing])
+        except Exception as e:
+            self.governor.record_failure()
+            self.metrics.count("errors")
+            if DEBUG:
+                logging.error("Error running inference: %s", e)
+            return None
+        finally:
+            # Failed calls are timed too, timeouts are the slowest calls there are
+            self.metrics.observe("inference", start)
+        self.governor.record_success()
+        for i, result in zip(missing, results):
+            self.prediction_cache.store(hashes[i], result)
+            if self.recorder is not None:
+                self.recorder.add_detections(hashes[i], result)
+        inferred = dict(zip((hashes[i] for i in missing), results))
+        predictions = [cached if cached is not None else inferred[frame_hash]
+                       for cached, frame_hash in zip(predictions, hashes)]
+        self.metrics.count("inferences", len(missing))
+        return predictions
+
+    def score_results(self):
+        next_seq = 0
+        pending = []  # Min-heap of results that finished ahead of next_seq
+        self.display_accuracy(100)
+
+        while self.running:
+            item = self.results.get(timeout=0.1)
+            if item is not None:
+                heapq.heappush(pending, item)
+
+            # Workers finish out of order, score strictly in click order
+            while pending and pending[0][0] <= next_seq:
+                seq, click_time, before, after, frame_times = heapq.heappop(pending)
+                next_seq = seq + 1
+                if after is None:
+                    continue  # Inference failed or the click was dropped
+
+                start = self.metrics.start()
+                self.total_clicks += 1
+                hit = len(after) < len(before)
+                if hit:
+                    self.accurate_clicks += 1
+                self.scored += 1
+                if self.recorder is not None:
+                    # Replays judge exactly these clicks on exactly these frames
+                    self.recorder.add_click(click_time, "hit" if hit else "miss", *frame_times)
+
+                # Calculate and display accuracy on the screen
+                accuracy = (self.accurate_clicks / self.total_clicks) * 100
+                self.display_accuracy(accuracy)
+                self.metrics.observe("scoring", start)
+                self.metrics.record("click_to_verdict", self.clock() - click_time)
 
         accuracy = (self.accurate_clicks / self.total_clicks) * 100 if self.total_clicks > 0 else 100
         self.display_accuracy(accuracy)
         if DEBUG:
+            logging.info("Pipeline stats: %s", self.pipeline_stats())
             logging.info("Final Accuracy: %.2f%%", accuracy)
 
+    def export_metrics(self):
+        last_export = time.monotonic()
+        while self.running:
+            time.sleep(0.1)
+            if time.monotonic() - last_export >= METRICS_INTERVAL:
+                self.write_metrics()
+                last_export = time.monotonic()
+        self.write_metrics()
+
+    def write_metrics(self):
+        line = {"time": time.time(), **self.metrics.snapshot(), "pipeline": self.pipeline_stats()}
+        try:
+            with open(METRICS_FILE, "a") as metrics_file:
+                metrics_file.write(json.dumps(line) + "\n")
+        except OSError as e:
+            logging.error("Error writing metrics: %s", e)
+
+    def pipeline_stats(self):
+        return {
+            "captured": self.captured,
+            "clicks_waiting": len(self.clicks),
+            "clicks_unscored": self.unscored,
+            "clicks_failed": self.failed,
+            "clicks_dropped": self.jobs.dropped,
+            "click_queue_depth": self.jobs.depth(),
+            "in_flight": self.in_flight,
+            "cache_misses": self.prediction_cache.misses,
+            "cache_hits": self.prediction_cache.hits,
+            "scoring_queue_depth": self.results.depth(),
+            "scored": self.scored,
+            **self.governor.stats(),
+            **self.backend.stats(),
+        }
+
     def display_accuracy(self, accuracy):
-        overlay.fill((0, 0, 0, 0))  # Clear the overlay
-        accuracy_text = f"Accuracy: {accuracy:.2f}%"
-        font = pygame.font.SysFont("Arial", 30)
-        text_surface = font.render(accuracy_text, True, (0, 255, 0))
-        overlay.blit(text_surface, (10, screen_height - 40))
-        pygame.display.update()
-        if DEBUG:
-            logging.info("Displayed accuracy: %s", accuracy_text)
+        self.accuracy_updates.put(accuracy)
+
+    def latest_accuracy(self):
+        """Return the newest accuracy posted since the last call, or None."""
+        accuracy = None
+        while True:
+            try:
+                accuracy = self.accuracy_updates.get_nowait()
+            except Empty:
+                return accuracy
 
     def stop(self):
         self.stop_thread = True
-        self.thread.join()
-        self.mouse_listener.stop()
-        self.keyboard_listener.stop()
-        pygame.quit()
+        self.governor.wake.set()
+        for thread in self.threads:
+            thread.join()
+        for listener in self.listeners:
+            listener.stop()
+        self.backend.close()
+        if self.recorder is not None:
+            for click_time in self.clicks:
+                self.recorder.add_click(click_time, "waiting")  # Stopped before their after frame came
+            self.recorder.close(self.total_clicks, self.accurate_clicks)
         if DEBUG:
             logging.info("FrameProcessor stopped")
 
 if __name__ == "__main__":
+    if INFERENCE_BACKEND == "http":
+        check_api_key()
     api_url = "https://detect.roboflow.com"
     model_id = "valoaccuracy/5"
-    frame_processor = FrameProcessor(api_url, API_KEY, model_id)
+    backend = create_backend(INFERENCE_BACKEND, api_url, API_KEY, model_id)
+    create_overlay()
+    readout = AccuracyOverlay(overlay, (10, screen_height - 40))
+    frame_processor = FrameProcessor(backend)
     frame_processor.start()
 
     while not frame_processor.quit_keys_pressed:
@@ -163,6 +1213,13 @@ if __name__ == "__main__":
             elif event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_ESCAPE:
                     frame_processor.quit_keys_pressed = True
+        accuracy = frame_processor.latest_accuracy()
+        if accuracy is not None:
+            readout.show(accuracy)
         time.sleep(0.01)
 
     frame_processor.stop()
+    accuracy = frame_processor.latest_accuracy()
+    if accuracy is not None:
+        readout.show(accuracy)
+    pygame.quit()
@@ -22,7 +22,8 @@ a = Analysis(
         'cv2',
         'numpy',
         'dotenv',
-        'inference_sdk',
+        'requests',
+        'onnxruntime',
         'pygame',
         'PIL.Image',
         'io',
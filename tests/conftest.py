@@ -0,0 +1,20 @@
+import os
+import sys
+
+import pytest
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import main  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def default_settings(monkeypatch):
+    # Keep a developer's .env from turning on recording or metrics export in tests
+    monkeypatch.setattr(main, "RECORD_DIR", "")
+    monkeypatch.setattr(main, "METRICS_FILE", "")
+    monkeypatch.setattr(main, "INFERENCE_WORKERS", 4)
+    monkeypatch.setattr(main, "RING_SIZE", 8)
+    monkeypatch.setattr(main, "CLICK_SETTLE", 1.0)
+    monkeypatch.setattr(main, "HASH_CACHE_SIZE", 64)
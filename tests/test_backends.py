@@ -0,0 +1,119 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+import main
+
+
+def test_fake_backend_counts_from_brightness():
+    backend = main.FakeBackend()
+    frame = np.full((8, 8, 3), 6, dtype=np.uint8)
+
+    predictions = backend.infer(frame)
+
+    assert len(predictions) == 2
+    assert backend.infer(frame) == predictions
+    assert backend.infer_batch([frame, np.zeros_like(frame)]) == [predictions, []]
+
+
+def test_fake_backend_latency():
+    backend = main.FakeBackend(latency=0.05)
+    frame = np.zeros((8, 8, 3), dtype=np.uint8)
+
+    start = time.perf_counter()
+    backend.infer_batch([frame, frame])
+
+    assert time.perf_counter() - start >= 0.1
+
+
+def decoder(input_size=(640, 640)):
+    # OnnxBackend without a model, enough for letterbox() and decode()
+    backend = object.__new__(main.OnnxBackend)
+    backend.input_size = input_size
+    backend.confidence = 0.4
+    backend.class_names = {0: "enemy"}
+    return backend
+
+
+def test_letterbox_keeps_aspect_ratio():
+    backend = decoder()
+    padded = np.empty((640, 640, 3), dtype=np.uint8)
+
+    scale, pad_x, pad_y = backend.letterbox(np.full((1080, 1920, 3), 255, dtype=np.uint8), padded)
+
+    assert (scale, pad_x, pad_y) == (pytest.approx(1 / 3), 0, 140)
+    assert (padded[:140] == 114).all() and (padded[500:] == 114).all()
+    assert (padded[140:500] == 255).all()
+
+
+def test_decode_maps_boxes_back_to_frame_pixels():
+    backend = decoder()
+    frame = np.zeros((1080, 1920, 3), dtype=np.uint8)
+    transform = backend.letterbox(frame, np.empty((640, 640, 3), dtype=np.uint8))
+    # A box centred on the frame, 300x150 pixels, as the model sees it after the letterbox
+    output = np.array([
+        [320, 50],
+        [320, 50],
+        [100, 10],
+        [50, 10],
+        [0.9, 0.1],  # The second anchor is under the confidence threshold
+    ], dtype=np.float32)
+
+    predictions = backend.decode(output, *transform)
+
+    assert len(predictions) == 1
+    assert predictions[0]["class"] == "enemy"
+    assert predictions[0]["confidence"] == pytest.approx(0.9)
+    assert [predictions[0][key] for key in ("x", "y", "width", "height")] == \
+        pytest.approx([960, 540, 300, 150])
+
+
+@pytest.fixture
+def tiny_model(tmp_path):
+    onnx = pytest.importorskip("onnx")
+    pytest.importorskip("onnxruntime")
+    from onnx import TensorProto, helper, numpy_helper
+
+    # Reads the first pixel row: boxes are 64 * RGB, class scores are G and B,
+    # so frames of different colours give different detections
+    images = helper.make_tensor_value_info("images", TensorProto.FLOAT, ["batch", 3, 64, 64])
+    output = helper.make_tensor_value_info("output", TensorProto.FLOAT, ["batch", 6, 10])
+    constants = [numpy_helper.from_array(np.array(value), name) for name, value in (
+        ("starts", [0, 0, 0, 0]), ("ends", [1 << 20, 3, 1, 10]), ("axes", [0, 1, 2, 3]),
+        ("row_axis", [2]), ("box_scale", np.float32(64)),
+    )]
+    nodes = [
+        helper.make_node("Slice", ["images", "starts", "ends", "axes"], ["row"]),
+        helper.make_node("Squeeze", ["row", "row_axis"], ["pixels"]),
+        helper.make_node("Mul", ["pixels", "box_scale"], ["boxes"]),
+        helper.make_node("Concat", ["boxes", "pixels"], ["output"], axis=1),
+    ]
+    model = helper.make_model(helper.make_graph(nodes, "tiny", [images], [output], constants),
+                              opset_imports=[helper.make_opsetid("", 13)])
+    model.ir_version = 8
+    path = tmp_path / "tiny.onnx"
+    onnx.save(model, str(path))
+    return str(path)
+
+
+def test_onnx_backend_batches_concurrent_frames(tiny_model):
+    frames = [np.full((48, 64, 3), (0, 100 + 15 * i, 200), dtype=np.uint8) for i in range(8)]
+    backend = main.OnnxBackend(tiny_model, batch_size=4, batch_wait=0.2, threads=1, confidence=0.3)
+    try:
+        alone = [backend.infer(frame) for frame in frames]
+        batches_alone = backend.batches
+
+        with ThreadPoolExecutor(len(frames)) as pool:
+            batched = list(pool.map(backend.infer, frames))
+        stats = backend.stats()
+    finally:
+        backend.close()
+
+    assert batches_alone == len(frames)
+    assert backend.batches - batches_alone < len(frames)
+    assert stats["frames_per_batch"] > 1
+    # Each frame gets its own detections back, whichever batch it went in
+    assert batched == alone
+    assert all(alone)
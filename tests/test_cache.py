@@ -0,0 +1,66 @@
+import numpy as np
+
+import main
+
+
+class NoScreen:
+    """Grabber for a processor that is never asked to capture."""
+
+    region = {"left": 0, "top": 0, "width": 8, "height": 8}
+
+    def close(self):
+        pass
+
+
+class CountingBackend(main.FakeBackend):
+    def __init__(self):
+        super().__init__()
+        self.frames = 0
+
+    def infer_batch(self, frames):
+        self.frames += len(frames)
+        return super().infer_batch(frames)
+
+
+def test_frame_hash_only_matches_identical_frames():
+    cache = main.PredictionCache(4)
+    frame = np.zeros((8, 8, 3), dtype=np.uint8)
+    nudged = frame.copy()
+    nudged[7, 7, 2] = 1
+
+    assert cache.frame_hash(frame) == cache.frame_hash(frame.copy())
+    assert cache.frame_hash(frame) != cache.frame_hash(nudged)
+
+
+def test_lookup_counts_hits_and_misses():
+    cache = main.PredictionCache(4)
+
+    assert cache.lookup(b"a") is None
+    cache.store(b"a", [])  # An empty prediction list is still a hit
+    assert cache.lookup(b"a") == []
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = main.PredictionCache(2)
+    cache.store(b"a", ["a"])
+    cache.store(b"b", ["b"])
+    cache.lookup(b"a")  # Now b is the least recently used
+
+    cache.store(b"c", ["c"])
+
+    assert list(cache.cache) == [b"a", b"c"]
+    assert cache.lookup(b"b") is None
+
+
+def test_predict_sends_repeated_frames_once():
+    backend = CountingBackend()
+    processor = main.FrameProcessor(backend, grabber=NoScreen(), listen=False)
+    frame = np.full((8, 8, 3), 6, dtype=np.uint8)
+
+    # The same frame twice in one request, then again in the next
+    assert processor.predict([frame, frame.copy()]) == [backend.infer(frame)] * 2
+    assert processor.predict([frame, frame]) == [backend.infer(frame)] * 2
+
+    assert backend.frames == 1
+    assert (processor.prediction_cache.hits, processor.prediction_cache.misses) == (2, 2)
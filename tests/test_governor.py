@@ -0,0 +1,121 @@
+from threading import Thread
+import time
+
+import pytest
+
+import main
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+def governor(clock, max_rate=0, failure_threshold=3):
+    return main.FrameRateGovernor(0.05, 0.5, 2.0, max_rate, failure_threshold, base_backoff=0.5, max_backoff=4.0,
+                                  clock=clock)
+
+
+def test_capture_speeds_up_on_activity_and_idles_after(clock):
+    scheduler = governor(clock)
+    assert scheduler.idle and scheduler.capture_interval() == 0.5
+
+    scheduler.note_activity()
+    assert scheduler.wake.is_set()  # Idle to active wakes capture from its long wait
+    assert scheduler.capture_interval() == 0.05
+
+    scheduler.wake.clear()
+    clock.advance(1.0)
+    scheduler.note_activity()
+    assert not scheduler.wake.is_set()  # Already active, capture is on its short interval anyway
+
+    clock.advance(2.0)
+    assert scheduler.idle and scheduler.capture_interval() == 0.5
+
+
+def test_failures_back_off_exponentially(clock):
+    scheduler = governor(clock, failure_threshold=10)
+    delays = []
+    for _ in range(5):
+        scheduler.record_failure()
+        delays.append(scheduler.inference_delay())
+        clock.advance(delays[-1])
+    assert delays == [0.5, 1.0, 2.0, 4.0, 4.0]  # Capped at max_backoff
+    assert scheduler.inference_delay() == 0
+
+    scheduler.record_success()
+    scheduler.record_failure()
+    assert scheduler.inference_delay() == 0.5  # Success starts the backoff over
+
+
+def test_breaker_opens_then_one_trial_closes_it(clock):
+    scheduler = governor(clock)
+    for _ in range(3):
+        scheduler.record_failure()
+    assert scheduler.state == main.FrameRateGovernor.OPEN
+    assert scheduler.stats()["breaker_opened"] == 1
+    assert scheduler.inference_delay() == 2.0
+
+    clock.advance(2.0)
+    assert scheduler.inference_delay() == 0  # The trial call
+    assert scheduler.state == main.FrameRateGovernor.HALF_OPEN
+    assert scheduler.inference_delay() > 0  # Everyone else waits on the trial
+
+    scheduler.record_success()
+    assert scheduler.state == main.FrameRateGovernor.CLOSED
+    assert scheduler.inference_delay() == 0
+
+
+def test_failed_trial_opens_the_breaker_again(clock):
+    scheduler = governor(clock)
+    for _ in range(3):
+        scheduler.record_failure()
+    clock.advance(2.0)
+    assert scheduler.inference_delay() == 0
+
+    scheduler.record_failure()
+
+    assert scheduler.state == main.FrameRateGovernor.OPEN
+    assert scheduler.inference_delay() == 4.0
+    assert scheduler.stats()["breaker_opened"] == 2
+
+
+def test_token_bucket_limits_calls_per_second(clock):
+    scheduler = governor(clock, max_rate=4)
+    assert [scheduler.inference_delay(2) for _ in range(2)] == [0, 0]  # A full bucket of four calls
+
+    assert scheduler.inference_delay(2) == pytest.approx(0.5)  # Two tokens at four per second
+    clock.advance(0.25)
+    assert scheduler.inference_delay(2) == pytest.approx(0.25)
+    clock.advance(0.25)
+    assert scheduler.inference_delay(2) == 0
+
+    clock.advance(10)
+    assert scheduler.inference_delay(4) == 0  # Refills up to capacity, never past it
+    assert scheduler.inference_delay(1) == pytest.approx(0.25)
+
+
+def test_activity_wakes_idle_capture():
+    # Real clock, capture is idling on a ten second interval
+    scheduler = main.FrameRateGovernor(0.01, 10.0, 0.5, 0, 3)
+    woke = []
+    waiter = Thread(target=lambda: woke.append(scheduler.wake.wait(scheduler.capture_interval())))
+    waiter.start()
+
+    start = time.monotonic()
+    scheduler.note_activity()
+    waiter.join(2)
+
+    assert woke == [True]
+    assert time.monotonic() - start < 1
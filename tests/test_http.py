@@ -0,0 +1,104 @@
+import json
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from threading import Thread
+
+import numpy as np
+import pytest
+
+import main
+
+
+class InferenceStandIn(BaseHTTPRequestHandler):
+    """Answers like the hosted API after server.latency seconds, with one box in upload pixels."""
+
+    protocol_version = "HTTP/1.1"  # Keep-alive, as the hosted API does
+
+    def do_POST(self):
+        self.server.connections.add(self.client_address)
+        self.server.uploads.append(len(self.rfile.read(int(self.headers["Content-Length"]))))
+        time.sleep(self.server.latency)
+        body = json.dumps({"predictions": [{"x": 100, "y": 50, "width": 40, "height": 20, "class": "enemy"}]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), InferenceStandIn)
+    server.latency = 0.0
+    server.connections = set()
+    server.uploads = []
+    thread = Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def url(server):
+    return f"http://127.0.0.1:{server.server_port}"
+
+
+def transport(server, target_rtt=1.0):
+    return main.HTTPTransport(url(server), "key", "model/1", 640, 80, target_rtt, 4)
+
+
+def frame():
+    return np.random.default_rng(0).integers(0, 256, (1080, 1920, 3), dtype=np.uint8)
+
+
+def test_predictions_map_back_to_frame_pixels(server):
+    uploader = transport(server)
+
+    predictions = uploader.infer(frame())
+    uploader.close()
+
+    # 1920 wide frames upload at 640, a factor of 3
+    assert [predictions[0][key] for key in ("x", "y", "width", "height")] == pytest.approx([300, 150, 120, 60])
+
+
+def test_uploads_reuse_one_connection(server):
+    uploader = transport(server)
+
+    for _ in range(5):
+        uploader.infer(frame())
+    stats = uploader.stats()
+    uploader.close()
+
+    assert len(server.connections) == 1
+    assert stats["frames_sent"] == 5
+    assert stats["bytes_per_frame"] == sum(server.uploads) // 5
+    assert stats["encode_ms"] > 0
+
+
+def test_quality_then_scale_drop_when_over_target_rtt(server):
+    server.latency = 0.02
+    uploader = transport(server, target_rtt=0.005)
+
+    for _ in range(main.HTTPTransport.ADAPT_EVERY * 5):
+        uploader.infer(frame())
+    stats = uploader.stats()
+    uploader.close()
+
+    assert stats["jpeg_quality"] == main.HTTPTransport.MIN_QUALITY
+    assert stats["upload_scale"] < 1.0
+
+
+def test_batch_frames_are_posted_together(server):
+    server.latency = 0.2
+    backend = main.HTTPBackend(url(server), "key", "model/1")
+
+    start = time.perf_counter()
+    results = backend.infer_batch([frame(), frame()])
+    elapsed = time.perf_counter() - start
+    backend.close()
+
+    assert len(results) == 2 and all(len(predictions) == 1 for predictions in results)
+    assert elapsed < 0.35
@@ -0,0 +1,102 @@
+import json
+import logging
+
+import numpy as np
+import pytest
+
+import main
+
+
+class NoScreen:
+    region = {"left": 0, "top": 0, "width": 8, "height": 8}
+
+    def close(self):
+        pass
+
+
+class FailingBackend(main.InferenceBackend):
+    def infer(self, frame):
+        raise TimeoutError("no answer")
+
+
+@pytest.mark.parametrize("fraction", [0.5, 0.95, 0.99])
+def test_percentile_is_within_a_bucket_of_the_true_value(fraction):
+    histogram = main.Histogram()
+    samples = [ms / 1000 for ms in range(1, 101)]
+    for seconds in samples:
+        histogram.record(seconds)
+
+    true_value = samples[int(fraction * len(samples)) - 1]
+    assert true_value <= histogram.percentile(fraction) <= true_value * 1.25
+
+
+def test_percentile_edges():
+    histogram = main.Histogram()
+    assert histogram.percentile(0.99) == 0.0
+
+    histogram.record(0.003)
+    assert histogram.percentile(0.5) == 0.003  # Capped at the largest sample seen
+    histogram.record(1e6)  # Past the last bucket
+    assert histogram.percentile(1.0) == 1e6
+
+
+def test_disabled_metrics_record_nothing():
+    metrics = main.Metrics(False)
+
+    start = metrics.start()
+    metrics.observe("capture", start)
+    metrics.record("click_to_verdict", 0.2)
+    metrics.count("frames")
+
+    assert start == 0.0
+    assert metrics.snapshot() == {"counters": {}, "stages": {}}
+
+
+def test_snapshot_reports_stage_percentiles_and_counters():
+    metrics = main.Metrics(True)
+    for seconds in (0.01, 0.02, 0.03):
+        metrics.record("inference", seconds)
+    metrics.count("inferences", 3)
+
+    snapshot = metrics.snapshot()
+
+    assert snapshot["counters"] == {"inferences": 3}
+    assert snapshot["stages"]["inference"]["count"] == 3
+    assert snapshot["stages"]["inference"]["max_ms"] == 30.0
+    assert snapshot["stages"]["inference"]["p50_ms"] <= snapshot["stages"]["inference"]["p99_ms"] <= 30.0
+
+
+def test_failed_inference_is_timed():
+    processor = main.FrameProcessor(FailingBackend(), grabber=NoScreen(), listen=False, metrics=main.Metrics(True))
+
+    assert processor.predict([np.zeros((8, 8, 3), dtype=np.uint8)]) is None
+
+    snapshot = processor.metrics.snapshot()
+    assert snapshot["stages"]["inference"]["count"] == 1
+    assert snapshot["counters"]["errors"] == 1
+
+
+def test_write_metrics_appends_json_lines(tmp_path, monkeypatch):
+    path = tmp_path / "metrics.jsonl"
+    monkeypatch.setattr(main, "METRICS_FILE", str(path))
+    processor = main.FrameProcessor(main.FakeBackend(), grabber=NoScreen(), listen=False, metrics=main.Metrics(True))
+    processor.metrics.record("capture", 0.004)
+
+    processor.write_metrics()
+    processor.write_metrics()
+
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(lines) == 2
+    assert lines[0]["stages"]["capture"]["count"] == 1
+    assert lines[0]["pipeline"]["clicks_dropped"] == 0
+    assert lines[0]["time"] <= lines[1]["time"]
+
+
+def test_write_metrics_logs_instead_of_raising(tmp_path, monkeypatch, caplog):
+    monkeypatch.setattr(main, "METRICS_FILE", str(tmp_path))  # A dir, so the open fails
+    processor = main.FrameProcessor(main.FakeBackend(), grabber=NoScreen(), listen=False, metrics=main.Metrics(True))
+
+    with caplog.at_level(logging.ERROR):
+        processor.write_metrics()
+
+    assert "Error writing metrics" in caplog.text
@@ -0,0 +1,217 @@
+import time
+from threading import Thread
+
+import numpy as np
+import pytest
+
+import main
+
+
+class ListGrabber:
+    """Serves a fixed list of frames in place of the screen, wrapping around at the end."""
+
+    def __init__(self, frames):
+        self.frames = frames
+        self.index = 0
+        self.region = {"left": 0, "top": 0, "width": frames[0].shape[1], "height": frames[0].shape[0]}
+
+    def grab(self, frame):
+        np.copyto(frame, self.frames[self.index % len(self.frames)])
+        self.index += 1
+        return frame
+
+    def close(self):
+        pass
+
+
+class DelayedBackend(main.FakeBackend):
+    """FakeBackend whose latency is the delay make_frame put in pixel (0, 0), in hundredths of a second."""
+
+    def infer(self, frame):
+        time.sleep((int(frame[0, 0, 0]) - int(frame[0, 0, 2])) / 100)
+        return super().infer(frame)
+
+
+class FailingBackend(main.InferenceBackend):
+    def infer(self, frame):
+        raise RuntimeError("inference is down")
+
+
+def make_frame(count, marker, delay=0):
+    # FakeBackend sees int(mean) % 4 objects, the marker pixels keep frames distinct without moving the mean
+    frame = np.full((64, 64, 3), 4 + count, dtype=np.uint8)
+    frame[0, 0, 0] += delay
+    frame[0, 0, 1] += marker
+    return frame
+
+
+def make_processor(backend, frames, base_backoff=0.01, click_queue_size=None):
+    governor = main.FrameRateGovernor(0.01, 0.01, 1.0, 0, 3, base_backoff=base_backoff)
+    return main.FrameProcessor(backend, grabber=ListGrabber(frames), listen=False,
+                               metrics=main.Metrics(True), governor=governor, click_queue_size=click_queue_size)
+
+
+def feed_clicks(processor, pairs):
+    """Feed one click per (before, after) frame pair, one second of session time apart."""
+    for k, (before, after) in enumerate(pairs):
+        processor.grabber.frames[3 * k:3 * k + 3] = [before, before, after]
+    for k in range(len(pairs)):
+        processor.capture_frame(3 * k)
+        processor.capture_frame(3 * k + 1)
+        processor.record_click(3 * k + 0.5)
+        processor.capture_frame(3 * k + 2)  # The first frame past the settle delay dispatches the click
+
+
+def wait_until_judged(processor, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while processor.busy():
+        assert time.monotonic() < deadline, processor.pipeline_stats()
+        time.sleep(0.005)
+
+
+def accuracy_updates(processor):
+    updates = []
+    while not processor.accuracy_updates.empty():
+        updates.append(round(processor.accuracy_updates.get(), 2))
+    return updates
+
+
+def test_stage_queue_drops_oldest_when_full():
+    dropped = []
+    queue = main.StageQueue(2, on_drop=dropped.append)
+    for item in (1, 2, 3):
+        queue.put(item)
+
+    assert dropped == [1]
+    assert queue.dropped == 1
+    assert [queue.get(timeout=0), queue.get(timeout=0)] == [2, 3]
+
+
+def test_stage_queue_get_times_out_when_empty():
+    assert main.StageQueue().get(timeout=0.01) is None
+
+
+def test_stage_queue_get_wakes_on_put():
+    queue = main.StageQueue()
+    Thread(target=lambda: (time.sleep(0.05), queue.put("frame"))).start()
+    assert queue.get(timeout=2) == "frame"
+
+
+def test_clicks_are_scored_in_click_order():
+    # The first click's frames take longest, so workers finish it last
+    pairs = [
+        (make_frame(3, 0, delay=30), make_frame(0, 1, delay=30)),  # hit
+        (make_frame(1, 2), make_frame(1, 3)),  # miss
+        (make_frame(2, 4), make_frame(2, 5)),  # miss
+        (make_frame(2, 6), make_frame(1, 7)),  # hit
+    ]
+    processor = make_processor(DelayedBackend(), [make_frame(0, 0)] * 12)
+    processor.start_workers()
+    feed_clicks(processor, pairs)
+    wait_until_judged(processor)
+    processor.stop()
+
+    assert (processor.total_clicks, processor.accurate_clicks) == (4, 2)
+    # Bracketed by the 100% shown before any click and the final value posted on stop
+    assert accuracy_updates(processor) == [100, 100, 50, 33.33, 50, 50]
+
+
+def test_scoring_moves_past_a_dropped_click():
+    processor = make_processor(main.FakeBackend(), [make_frame(0, 0)] * 6, click_queue_size=1)
+    # No workers yet, so the second click pushes the first out of the queue
+    feed_clicks(processor, [(make_frame(3, 0), make_frame(3, 1)), (make_frame(3, 2), make_frame(0, 3))])
+    assert processor.pipeline_stats()["clicks_dropped"] == 1
+
+    processor.start_workers()
+    wait_until_judged(processor)
+    processor.stop()
+
+    assert (processor.scored, processor.total_clicks, processor.accurate_clicks) == (1, 1, 1)
+    assert accuracy_updates(processor) == [100, 100, 100]
+
+
+def test_unbounded_click_queue_backs_up_without_dropping(monkeypatch):
+    # As replays run it, every click is scored however far behind inference is
+    monkeypatch.setattr(main, "INFERENCE_WORKERS", 2)
+    pairs = [(make_frame(2, 2 * k), make_frame(k % 3, 2 * k + 1)) for k in range(12)]
+    processor = make_processor(main.FakeBackend(latency=0.05), [make_frame(0, 0)] * 36, click_queue_size=0)
+    processor.start_workers()
+    feed_clicks(processor, pairs)
+    assert processor.jobs.depth() > 0  # Fed far faster than two workers can keep up with
+    wait_until_judged(processor)
+    processor.stop()
+
+    assert processor.scored == 12
+    assert processor.accurate_clicks == 8  # Every click whose after frame shows fewer than 2 objects
+
+
+def test_click_backlog_is_capped_while_inference_is_down():
+    # Every call fails and backs off for a second, so clicks pile up behind the workers
+    processor = make_processor(FailingBackend(), [make_frame(0, 0)] * 90, base_backoff=1.0)
+    processor.start_workers()
+    feed_clicks(processor, [(make_frame(3, 2 * k), make_frame(0, 2 * k + 1)) for k in range(30)])
+    stats = processor.pipeline_stats()
+    processor.stop()
+
+    assert stats["click_queue_depth"] == processor.jobs.maxsize == 2 * main.INFERENCE_WORKERS
+    assert stats["clicks_dropped"] > 0
+    # Every click is accounted for: dropped, still queued, or failed by a worker
+    assert processor.dispatched == 30 == processor.jobs.dropped + processor.jobs.depth() + processor.failed
+    assert stats["clicks_unscored"] == 0
+    assert processor.metrics.snapshot()["counters"]["dropped_clicks"] == processor.jobs.dropped
+
+
+def test_failed_inference_leaves_the_click_out():
+    processor = make_processor(FailingBackend(), [make_frame(0, 0)] * 3)
+    processor.start_workers()
+    feed_clicks(processor, [(make_frame(3, 0), make_frame(0, 1))])
+    wait_until_judged(processor)
+    processor.stop()
+
+    assert processor.failed == 1
+    assert processor.total_clicks == 0
+    assert processor.metrics.snapshot()["counters"]["errors"] == 1
+
+
+def test_stop_joins_every_thread_with_inference_in_flight():
+    processor = make_processor(main.FakeBackend(latency=0.3), [make_frame(3, 0), make_frame(0, 1)])
+    processor.start()
+    processor.record_click(processor.clock())
+    time.sleep(0.1)
+
+    start = time.monotonic()
+    processor.stop()
+    assert time.monotonic() - start < 2
+    assert processor.threads and not any(thread.is_alive() for thread in processor.threads)
+    assert processor.captured > 0
+
+
+def test_idle_capture_wakes_on_click_and_stop():
+    processor = make_processor(main.FakeBackend(), [make_frame(0, 0)])
+    processor.governor = main.FrameRateGovernor(0.01, 10.0, 0.5, 0, 3)  # Idle capture waits ten seconds
+    processor.start()
+    time.sleep(0.1)
+    captured = processor.captured
+
+    processor.record_click(processor.clock())
+    time.sleep(0.1)
+    assert processor.captured > captured + 1  # Woken at once, then on the active interval
+
+    time.sleep(0.6)  # Idle again
+    start = time.monotonic()
+    processor.stop()
+    assert time.monotonic() - start < 2
+
+
+@pytest.mark.parametrize("timestamps, click, expected", [
+    ([0, 1, 2], 1.5, (1, 2)),
+    ([0, 1, 2], 1.0, (1, 2)),
+])
+def test_frame_ring_finds_frames_around_a_click(timestamps, click, expected):
+    ring = main.FrameRing(4, 2, 2)
+    for timestamp in timestamps:
+        ring.slot()[:] = timestamp
+        ring.commit(timestamp)
+
+    before, after = ring.before(click), ring.after(click + 0.5)
+    assert (ring.copy(before)[0, 0, 0], ring.copy(after)[0, 0, 0]) == expected
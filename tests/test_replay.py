@@ -0,0 +1,124 @@
+import json
+import os
+import time
+
+import cv2
+import numpy as np
+
+import bench
+import main
+
+
+class SceneGrabber:
+    """Serves frame i as a flat scene FakeBackend sees scenes[i] objects in."""
+
+    def __init__(self, scenes):
+        self.scenes = scenes
+        self.index = 0
+        self.region = {"left": 0, "top": 0, "width": 32, "height": 24}
+
+    def grab(self, frame):
+        frame[:] = 4 + self.scenes[self.index]
+        frame[0, 0, 0] = self.index  # Keeps every frame distinct without moving the mean
+        self.index += 1
+        return frame
+
+    def close(self):
+        pass
+
+
+def record_session(path, monkeypatch, late_click=None):
+    """Record twelve frames a second apart with a click half a second after frames 1, 4, 7 and 10.
+
+    late_click is (frame, time) for a click that only reaches the processor after that frame.
+    """
+    monkeypatch.setattr(main, "RECORD_DIR", str(path))
+    scenes = [3, 3, 1, 2, 2, 2, 0, 0, 0, 1, 1, 0]
+    governor = main.FrameRateGovernor(0.01, 0.01, 1.0, 0, 3, base_backoff=0.01)
+    processor = main.FrameProcessor(main.FakeBackend(), grabber=SceneGrabber(scenes), listen=False,
+                                    metrics=main.Metrics(True), governor=governor)
+    processor.start_workers()
+    for timestamp in range(len(scenes)):
+        processor.capture_frame(timestamp)
+        if timestamp % 3 == 1:
+            processor.record_click(timestamp + 0.5)
+        if late_click and late_click[0] == timestamp:
+            processor.record_click(late_click[1])
+    while processor.busy():
+        time.sleep(0.005)
+    processor.stop()
+    return processor
+
+
+def test_recording_keeps_only_judged_frames(tmp_path, monkeypatch):
+    processor = record_session(tmp_path, monkeypatch)
+
+    session = main.load_session(str(tmp_path))
+
+    # Three judged clicks need a before and an after frame each, the fourth never settled
+    assert processor.captured == 12 and processor.scored == 3
+    assert list(session["timestamps"]) == [1, 3, 4, 6, 7, 9]
+    assert session["meta"]["frames"] == 6
+    assert [(click["outcome"], click["before"], click["after"]) for click in session["clicks"]] == [
+        ("hit", 1, 3), ("hit", 4, 6), ("miss", 7, 9), ("waiting", None, None),
+    ]
+    assert os.path.getsize(tmp_path / "frames.bin") == sum(length for _, length in session["frames"])
+    # Frames come back bit for bit, so their hashes still find the recorded detections
+    expected = np.full((24, 32, 3), 4 + 3, dtype=np.uint8)
+    expected[0, 0, 0] = 1
+    assert np.array_equal(bench.ReplayGrabber(session).grab(np.empty((24, 32, 3), np.uint8)), expected)
+
+
+def test_replay_matches_recording(tmp_path, monkeypatch):
+    record_session(tmp_path / "session", monkeypatch)
+    monkeypatch.setattr(main, "RECORD_DIR", "")
+    session = main.load_session(str(tmp_path / "session"))
+
+    results = bench.replay_session(session, bench.ReplayBackend(session["detections"]))
+
+    assert results["clicks_scored"] == session["meta"]["total_clicks"] == 3
+    assert results["clicks_left_out"] == 0
+    assert results["accuracy_delta"] == 0
+    assert "click_to_verdict" not in results["stages"]  # Only meaningful with realtime
+
+
+def test_replay_skips_clicks_not_judged_live(tmp_path, monkeypatch):
+    # A click at 2.5 that arrives after frame 6, by when frame 2 has left a ring of three
+    monkeypatch.setattr(main, "RING_SIZE", 3)
+    processor = record_session(tmp_path, monkeypatch, late_click=(6, 2.5))
+    monkeypatch.setattr(main, "RECORD_DIR", "")
+    session = main.load_session(str(tmp_path))
+    assert processor.unscored == 1
+
+    results = bench.replay_session(session, bench.ReplayBackend(session["detections"]))
+
+    # Judging it on whichever recorded frames are nearby would make up a difference
+    assert results["clicks_not_judged_live"] == 2  # The unscored click and the one still waiting
+    assert results["clicks_scored"] == results["clicks"] == 3
+    assert results["accuracy_delta"] == 0
+
+
+def test_clicks_on_unrecorded_frames_are_left_out(tmp_path):
+    bench.synthesize_session(str(tmp_path), 60)
+    session = main.load_session(str(tmp_path))
+    hasher = main.PredictionCache(0)
+    offset, length = session["frames"][0]
+    first = cv2.imdecode(np.asarray(session["data"][offset:offset + length]), cv2.IMREAD_COLOR)
+    del session["detections"][hasher.frame_hash(first).hex()]
+
+    results = bench.replay_session(session, bench.ReplayBackend(session["detections"]))
+
+    assert results["clicks_left_out"] == 1
+    assert results["clicks_scored"] == len(session["clicks"]) - 1
+
+
+def test_synthetic_session_replays_exactly(tmp_path):
+    bench.synthesize_session(str(tmp_path), 120)
+    session = main.load_session(str(tmp_path))
+    with open(tmp_path / "meta.json") as meta_file:
+        meta = json.load(meta_file)
+
+    results = bench.replay_session(session, bench.ReplayBackend(session["detections"]), realtime=False)
+
+    assert results["clicks_scored"] == meta["total_clicks"] > 0
+    assert results["accuracy_delta"] == 0